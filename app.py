@@ -4,21 +4,12 @@ A modern, dark-themed RAG application with LangChain + LlamaIndex + Gemini API
 """
 
 # CRITICAL: Fix SQLite before ANY other imports
-import sys
 import os
 
-# Must happen before chromadb is imported anywhere
-def patch_sqlite():
-    try:
-        import pysqlite3.dbapi2 as sqlite3_new
-        sys.modules['sqlite3'] = sqlite3_new
-        sys.modules['sqlite3.dbapi2'] = sqlite3_new
-        print(f"✅ SQLite patched to version: {sqlite3_new.sqlite_version}")
-    except ImportError:
-        import sqlite3
-        print(f"⚠️ Using system SQLite version: {sqlite3.sqlite_version}")
+# Must happen before chromadb is imported anywhere; a no-op after the first run
+from sqlite_fix import fix_sqlite
 
-patch_sqlite()
+fix_sqlite()
 
 import streamlit as st
 import os
@@ -26,12 +17,8 @@ from pathlib import Path
 import time
 from typing import List
 
-# Import our services
+# Import our services (heavy LangChain/LlamaIndex/Chroma modules load in initialize_services)
 from config.settings import config, validate_config, get_supported_file_types
-from services.document_processor import DocumentProcessor
-from services.vector_store import VectorStoreService
-from core.rag_chain import RAGChain
-from utils.cache_manager import CacheManager
 
 # Page configuration
 st.set_page_config(
@@ -42,115 +29,29 @@ st.set_page_config(
 )
 
 # Custom CSS for dark theme and modern styling
+@st.cache_resource
+def get_custom_css():
+    """Read the stylesheet once per process instead of on every rerun."""
+    return Path(__file__).parent.joinpath(".streamlit/style.css").read_text(encoding="utf-8")
+
 def load_custom_css():
-    st.markdown("""
-    <style>
-    /* Dark theme customization */
-    .stApp {
-        background: linear-gradient(135deg, #0f1419 0%, #1a1f2e 100%);
-    }
-    
-    /* Sidebar styling */
-    .css-1d391kg {
-        background: linear-gradient(180deg, #1e2329 0%, #2d3748 100%);
-    }
-    
-    /* Chat messages */
-    .chat-message {
-        padding: 1rem;
-        border-radius: 10px;
-        margin: 1rem 0;
-        border-left: 4px solid #4f46e5;
-        background: rgba(255, 255, 255, 0.05);
-        backdrop-filter: blur(10px);
-    }
-    
-    .user-message {
-        border-left-color: #10b981;
-        background: rgba(16, 185, 129, 0.1);
-    }
-    
-    .assistant-message {
-        border-left-color: #6366f1;
-        background: rgba(99, 102, 241, 0.1);
-    }
-    
-    /* Source cards */
-    .source-card {
-        background: rgba(255, 255, 255, 0.08);
-        border-radius: 8px;
-        padding: 1rem;
-        margin: 0.5rem 0;
-        border: 1px solid rgba(255, 255, 255, 0.1);
-    }
-    
-    /* Upload area */
-    .upload-area {
-        border: 2px dashed #4f46e5;
-        border-radius: 10px;
-        padding: 2rem;
-        text-align: center;
-        background: rgba(79, 70, 229, 0.1);
-        transition: all 0.3s ease;
-    }
-    
-    /* Metrics cards */
-    .metric-card {
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        padding: 1rem;
-        border-radius: 10px;
-        color: white;
-        text-align: center;
-        margin: 0.5rem 0;
-    }
-    
-    /* Animations */
-    @keyframes fadeIn {
-        from { opacity: 0; transform: translateY(20px); }
-        to { opacity: 1; transform: translateY(0); }
-    }
-    
-    .fade-in {
-        animation: fadeIn 0.5s ease-out;
-    }
-    
-    /* Custom buttons */
-    .stButton > button {
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        border: none;
-        border-radius: 8px;
-        color: white;
-        font-weight: 600;
-        transition: all 0.3s ease;
-    }
-    
-    .stButton > button:hover {
-        transform: translateY(-2px);
-        box-shadow: 0 8px 25px rgba(102, 126, 234, 0.4);
-    }
-    
-    /* File uploader */
-    .stFileUploader > div > div {
-        background: rgba(255, 255, 255, 0.05);
-        border-radius: 10px;
-        border: 2px dashed #4f46e5;
-    }
-    
-    /* Progress bars */
-    .stProgress > div > div {
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-    }
-    </style>
-    """, unsafe_allow_html=True)
+    # Streamlit drops elements not emitted during a rerun, so the style tag is re-sent each run
+    st.markdown(f"<style>{get_custom_css()}</style>", unsafe_allow_html=True)
 
+@st.cache_resource
 def get_persistent_session_id():
     """Get or create a persistent session ID based on machine characteristics."""
     import platform
     import hashlib
-    import os
+    
+    # os.getlogin() raises OSError when there is no controlling terminal (containers, services)
+    try:
+        login = os.getlogin()
+    except (AttributeError, OSError):
+        login = "user"
     
     # Create a persistent ID based on machine characteristics and user
-    machine_info = f"{platform.node()}_{platform.system()}_{os.getlogin() if hasattr(os, 'getlogin') else 'user'}"
+    machine_info = f"{platform.node()}_{platform.system()}_{login}"
     machine_hash = hashlib.md5(machine_info.encode()).hexdigest()[:8]
     persistent_id = f"ara_{machine_hash}"
     
@@ -188,6 +89,11 @@ def check_existing_documents(vector_store):
 @st.cache_resource
 def initialize_services():
     """Initialize all services with caching - using persistent session ID."""
+    from services.document_processor import DocumentProcessor
+    from services.vector_store import VectorStoreService
+    from core.rag_chain import RAGChain
+    from utils.cache_manager import CacheManager
+    
     # Use a consistent session ID for all tabs and browser instances
     persistent_session_id = get_persistent_session_id()
     
@@ -213,7 +119,7 @@ def display_header():
     </div>
     """, unsafe_allow_html=True)
 
-def display_sidebar(vector_store, cache_manager):
+def display_sidebar(doc_processor, vector_store, cache_manager, rag_chain):
     """Display the sidebar with file upload and system info."""
     with st.sidebar:
         st.markdown("### 📁 Document Management")
@@ -227,7 +133,7 @@ def display_sidebar(vector_store, cache_manager):
         )
         
         if uploaded_files:
-            process_uploaded_files(uploaded_files)
+            process_uploaded_files(uploaded_files, doc_processor, vector_store)
         
         # Collection info
         st.markdown("### 📊 Knowledge Base Status")
@@ -264,13 +170,11 @@ def display_sidebar(vector_store, cache_manager):
         
         with col2:
             if st.button("Clear Cache", type="secondary"):
-                if cache_manager.clear_cache():
+                if cache_manager.clear_cache() and rag_chain.clear_semantic_cache():
                     st.success("Cache cleared!")
 
-def process_uploaded_files(uploaded_files):
+def process_uploaded_files(uploaded_files, doc_processor, vector_store):
     """Process uploaded files and add to vector store."""
-    doc_processor, vector_store, _, _, _ = initialize_services()
-    
     progress_bar = st.progress(0)
     status_text = st.empty()
     
@@ -283,20 +187,36 @@ def process_uploaded_files(uploaded_files):
         st.info("All files already processed!")
         return
     
-    for i, uploaded_file in enumerate(new_files):
-        status_text.text(f"Processing {uploaded_file.name}...")
-        
-        # Process document
-        documents = doc_processor.process_uploaded_file(uploaded_file)
-        
-        if documents:
-            # Add to vector store
-            if vector_store.add_documents(documents):
-                st.session_state.uploaded_files.append(uploaded_file.name)
-                st.session_state.documents_processed += len(documents)
-                st.session_state.vector_store_ready = True
-        
-        progress_bar.progress((i + 1) / len(new_files))
+    # Parse and chunk files in parallel worker processes (CPU-bound, GIL-holding work)
+    status_text.text(f"Processing {len(new_files)} files...")
+    parsed = {}
+    for i, (index, chunks) in enumerate(doc_processor.process_uploaded_files(new_files)):
+        parsed[index] = chunks
+        progress_bar.progress((i + 1) / (len(new_files) + 1))
+    
+    # Collect all chunks in upload order so every chunk is embedded in one batched ingest
+    all_texts = []
+    all_metadatas = []
+    file_to_range = {}
+    for index, uploaded_file in enumerate(new_files):
+        if parsed[index]:
+            texts, metadatas = parsed[index]
+            file_to_range[uploaded_file.name] = (len(all_texts), len(all_texts) + len(texts))
+            all_texts.extend(texts)
+            all_metadatas.extend(metadatas)
+    
+    # Add to vector store
+    if all_texts:
+        status_text.text(f"Embedding {len(all_texts)} chunks...")
+        count_before = vector_store.get_collection_info().get("document_count", 0)
+        if vector_store.add_texts(all_texts, all_metadatas):
+            # Count rows actually stored; re-uploaded identical chunks overwrite existing rows
+            count_after = vector_store.get_collection_info().get("document_count", 0)
+            st.session_state.uploaded_files.extend(file_to_range.keys())
+            st.session_state.documents_processed += count_after - count_before
+            st.session_state.vector_store_ready = True
+    
+    progress_bar.progress(1.0)
     
     status_text.text("✅ Processing complete!")
     time.sleep(1)
@@ -306,6 +226,16 @@ def process_uploaded_files(uploaded_files):
     st.success(f"Processed {len(new_files)} new files!")
     st.rerun()
 
+def display_sources(sources):
+    """Display retrieved source cards in an expander."""
+    with st.expander("📚 Sources", expanded=False):
+        for i, source in enumerate(sources, 1):
+            # Native components skip Streamlit's HTML sanitizer on every rerun
+            with st.container(border=True):
+                st.markdown(f"**Source {i}: {source['source_file']}**")
+                st.caption(f"Relevance: {source['relevance_score']:.3f}")
+                st.write(source['content'])
+
 def display_chat_messages():
     """Display chat messages only."""
     # Display chat messages
@@ -315,15 +245,7 @@ def display_chat_messages():
             
             # Display sources if available
             if "sources" in message and message["sources"]:
-                with st.expander("📚 Sources", expanded=False):
-                    for i, source in enumerate(message["sources"], 1):
-                        st.markdown(f"""
-                        <div class="source-card">
-                            <strong>Source {i}: {source['source_file']}</strong><br>
-                            <small>Relevance: {source['relevance_score']:.3f}</small><br>
-                            <p style="margin-top: 0.5rem;">{source['content']}</p>
-                        </div>
-                        """, unsafe_allow_html=True)
+                display_sources(message["sources"])
 
 def handle_chat_input(rag_chain):
     """Handle chat input and response generation."""
@@ -333,37 +255,42 @@ def handle_chat_input(rag_chain):
             st.warning("Please upload some documents first!")
             return
         
-        # Add user message
-        st.session_state.messages.append({"role": "user", "content": prompt})
-        
-        with st.chat_message("user"):
-            st.markdown(prompt)
-        
-        # Generate response
-        with st.chat_message("assistant"):
+        # Several questions on separate lines are answered as one batch
+        questions = [line.strip() for line in prompt.splitlines() if line.strip()]
+        if len(questions) > 1:
             with st.spinner("Thinking..."):
-                response = rag_chain.query(prompt)
-            
-            st.markdown(response["answer"])
+                responses = rag_chain.query_batch(questions)
+        else:
+            questions = [prompt]
+            responses = None
+        
+        for index, question in enumerate(questions):
+            # Add user message
+            st.session_state.messages.append({"role": "user", "content": question})
             
-            # Add assistant message with sources
-            st.session_state.messages.append({
-                "role": "assistant", 
-                "content": response["answer"],
-                "sources": response["sources"]
-            })
+            with st.chat_message("user"):
+                st.markdown(question)
             
-            # Display sources
-            if response["sources"]:
-                with st.expander("📚 Sources", expanded=False):
-                    for i, source in enumerate(response["sources"], 1):
-                        st.markdown(f"""
-                        <div class="source-card">
-                            <strong>Source {i}: {source['source_file']}</strong><br>
-                            <small>Relevance: {source['relevance_score']:.3f}</small><br>
-                            <p style="margin-top: 0.5rem;">{source['content']}</p>
-                        </div>
-                        """, unsafe_allow_html=True)
+            # Generate response
+            with st.chat_message("assistant"):
+                if responses is None:
+                    # Retrieval happens up front; only generation is streamed
+                    with st.spinner("Thinking..."):
+                        answer_stream, response = rag_chain.stream_query(question)
+                    st.write_stream(answer_stream)
+                else:
+                    response = responses[index]
+                    st.markdown(response["answer"])
+                
+                # Add assistant message with sources
+                st.session_state.messages.append({
+                    "role": "assistant", 
+                    "content": response["answer"],
+                    "sources": response["sources"]
+                })
+        
+        # Sources are rendered once by display_chat_messages on the rerun
+        st.rerun()
 
 def display_api_key_setup():
     """Display API key setup interface."""
@@ -429,7 +356,7 @@ def main():
             display_chat_messages()
     
     with col2:
-        display_sidebar(vector_store, cache_manager)
+        display_sidebar(doc_processor, vector_store, cache_manager, rag_chain)
     
     # Chat input at the bottom (outside columns for full width)
     handle_chat_input(rag_chain)
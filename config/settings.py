@@ -22,20 +22,35 @@ class AppConfig:
     # Vector Database Settings
     CHROMA_PERSIST_DIRECTORY: str = "./chroma_db"
     COLLECTION_NAME: str = "documents"
+    FAST_INGEST_MODE: bool = False  # Tune Chroma persistence for bulk uploads
+    FAST_INGEST_HNSW_BATCH_SIZE: int = 1000
+    FAST_INGEST_HNSW_SYNC_THRESHOLD: int = 10000
+    # HNSW index parameters for newly created collections. M=8 is near-optimal up to
+    # ~10k chunks per collection; raise it to Chroma's default of 16 above that.
+    HNSW_SPACE: str = "ip"  # Stored and query vectors are unit length, so inner product ranks like cosine
+    HNSW_M: int = 8
+    HNSW_CONSTRUCTION_EF: int = 64
+    HNSW_SEARCH_EF: int = 32
     
     def get_user_collection_name(self, user_session_id: str) -> str:
         """Get user-specific collection name."""
         return f"user_{user_session_id}_docs"
     
+    def get_semantic_cache_collection_name(self, user_session_id: str) -> str:
+        """Get user-specific semantic query cache collection name."""
+        return f"semantic_cache_{user_session_id}"
+    
     # Document Processing
     CHUNK_SIZE: int = 1000
     CHUNK_OVERLAP: int = 200
     MAX_FILE_SIZE_MB: int = 10
+    EMBED_BATCH_SIZE: int = 100  # Texts per Gemini batch embedding request (API maximum is 100)
     
     # RAG Settings
     TOP_K_RETRIEVAL: int = 5
     TEMPERATURE: float = 0.1
     MAX_TOKENS: int = 1024
+    PREWARM_LLM: bool = True  # Warm the Gemini connection at startup with a 1-token request
     
     # UI Settings
     PAGE_TITLE: str = "🔍 Augmented Research Assistant"
@@ -45,12 +60,15 @@ class AppConfig:
     # Caching
     ENABLE_CACHING: bool = True
     CACHE_TTL: int = 3600  # 1 hour
+    QUANTIZE_EMBEDDINGS: bool = True  # Store cached embeddings as int8 with a per-vector scale
+    SEMANTIC_CACHE_THRESHOLD: float = 0.08  # Max cosine distance for a semantic cache hit
     
     def __post_init__(self):
         """Load environment variables after initialization."""
         self.GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
         self.GEMINI_CHAT_MODEL = os.getenv("GEMINI_CHAT_MODEL", self.GEMINI_CHAT_MODEL)
         self.GEMINI_EMBEDDING_MODEL = os.getenv("GEMINI_EMBEDDING_MODEL", self.GEMINI_EMBEDDING_MODEL)
+        self.FAST_INGEST_MODE = os.getenv("FAST_INGEST_MODE", str(self.FAST_INGEST_MODE)).lower() == "true"
 
 # Global config instance
 config = AppConfig()
@@ -1,27 +1,83 @@
 """RAG chain implementation using LangChain orchestration and Gemini API."""
 
-from typing import List, Dict, Any, Optional
+import asyncio
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import TYPE_CHECKING, List, Dict, Any, Iterator, Optional, Tuple
+import numpy as np
+import orjson
 import streamlit as st
 
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
-from langchain_core.documents import Document
-
 from config.settings import config
-from services.vector_store import VectorStoreService
-from utils.cache_manager import CacheManager
+from utils.text_utils import make_preview
+
+# LangChain and the Gemini client (gRPC, protobuf) are imported on first use
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+    from langchain_core.prompts import ChatPromptTemplate
+    from services.vector_store import VectorStoreService
+    from utils.cache_manager import CacheManager
+
+_PROMPT_TEMPLATE = """
+You are an intelligent research assistant. Answer the question based ONLY on the provided context from the user's documents.
+
+IMPORTANT RULES:
+1. Only use information from the provided context
+2. If the answer is not in the context, respond with "I couldn't find information about this in your documents."
+3. Be concise and accurate
+4. Cite specific parts of the context when possible
+5. Do not make assumptions or add information not in the context
+
+Context from documents:
+{context}
+
+Question: {question}
+
+Answer:"""
+
+
+# Dedicated pool so abandoned speculative retrievals don't block asyncio.run's
+# default-executor shutdown after a cache hit
+_RETRIEVAL_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="rag-retrieval")
+
+
+@lru_cache(maxsize=1)
+def _get_prompt() -> "ChatPromptTemplate":
+    """Compile the prompt template once, on first chain build."""
+    from langchain_core.prompts import ChatPromptTemplate
+    
+    return ChatPromptTemplate.from_template(_PROMPT_TEMPLATE)
+
+
+@lru_cache(maxsize=64)
+def _format_doc_entries(entries: Tuple[Tuple[str, str], ...]) -> str:
+    """Format (source, content) pairs for the prompt, memoized across repeated retrievals."""
+    return "\n\n".join(
+        f"[Source {i}: {source}]\n{content.strip()}"
+        for i, (source, content) in enumerate(entries, 1)
+    )
+
+
+def _normalize_scores(scores: np.ndarray) -> np.ndarray:
+    """Convert Chroma distances into relevance scores in (0, 1], higher is more relevant.
+    
+    Monotonic in the distance, so ranking holds for both l2 and cosine collections.
+    """
+    return 1.0 / (1.0 + scores)
 
 
 class RAGChain:
     """RAG chain orchestrator using LangChain and Gemini API."""
     
-    def __init__(self, vector_store: VectorStoreService, cache_manager: CacheManager = None):
+    def __init__(self, vector_store: "VectorStoreService", cache_manager: "CacheManager" = None):
         self.vector_store = vector_store
         self.cache_manager = cache_manager
         self.llm = None
         self.chain = None
+        self.semantic_cache = None
         self._initialize_llm()
         self._setup_chain()
     
@@ -32,6 +88,8 @@ class RAGChain:
                 st.error("Google API key not found.")
                 return
             
+            from langchain_google_genai import ChatGoogleGenerativeAI
+            
             self.llm = ChatGoogleGenerativeAI(
                 model=config.GEMINI_CHAT_MODEL,
                 google_api_key=config.GOOGLE_API_KEY,
@@ -39,52 +97,236 @@ class RAGChain:
                 max_output_tokens=config.MAX_TOKENS
             )
             
+            if config.PREWARM_LLM:
+                # Open the connection in the background so the first question skips the TLS handshake
+                threading.Thread(target=self._prewarm_llm, daemon=True).start()
+            
         except Exception as e:
             st.error(f"Error initializing LLM: {str(e)}")
     
+    def _prewarm_llm(self):
+        """Send a minimal request to warm the Gemini connection pool."""
+        try:
+            self.llm.invoke("ok", generation_config={"max_output_tokens": 1})
+        except Exception:
+            pass  # Prewarming is best-effort
+    
+    def _get_semantic_cache(self):
+        """Return the Chroma collection backing the semantic query cache, opening it on first use."""
+        if self.semantic_cache is None and config.ENABLE_CACHING:
+            session_id = self.vector_store.user_session_id or "default"
+            self.semantic_cache = self.vector_store.get_or_create_collection(
+                config.get_semantic_cache_collection_name(session_id),
+                metadata={"hnsw:space": "cosine"}
+            )
+        
+        return self.semantic_cache
+    
+    def _get_semantic_cached_query(self, question_embedding: List[float], doc_hash: str) -> Optional[Dict[str, Any]]:
+        """Return a cached result for a semantically equivalent earlier question."""
+        if question_embedding is None or not self._get_semantic_cache():
+            return None
+        
+        try:
+            results = self.semantic_cache.query(
+                query_embeddings=[question_embedding],
+                n_results=1,
+                where={"doc_hash": doc_hash},
+                include=["documents", "metadatas", "distances"]
+            )
+            
+            if not results["ids"] or not results["ids"][0]:
+                return None
+            
+            distance = results["distances"][0][0]
+            metadata = results["metadatas"][0][0]
+            
+            if distance >= config.SEMANTIC_CACHE_THRESHOLD:
+                return None
+            
+            # Check if cache is still valid (TTL)
+            if (time.time() - metadata.get("cached_at", 0)) >= config.CACHE_TTL:
+                return None
+            
+            return {
+                "answer": results["documents"][0][0],
+                "sources": orjson.loads(metadata.get("sources", "[]")),
+                "error": False
+            }
+        except Exception:
+            return None
+    
+    def _cache_semantic_query(self, question: str, question_embedding: List[float], result: Dict[str, Any], doc_hash: str) -> bool:
+        """Store a query result keyed by the question embedding."""
+        if question_embedding is None or result.get("error") or not self._get_semantic_cache():
+            return False
+        
+        try:
+            entry_id = hashlib.sha256(f"{question}:{doc_hash}".encode()).hexdigest()
+            self.semantic_cache.upsert(
+                ids=[entry_id],
+                embeddings=[question_embedding],
+                documents=[result["answer"]],
+                metadatas=[{
+                    "question": question,
+                    "doc_hash": doc_hash,
+                    "sources": orjson.dumps(result["sources"], option=orjson.OPT_SERIALIZE_NUMPY).decode(),
+                    "cached_at": time.time()
+                }]
+            )
+            return True
+        except Exception:
+            return False
+    
+    def clear_semantic_cache(self) -> bool:
+        """Remove all entries from the semantic query cache."""
+        try:
+            if not self._get_semantic_cache():
+                return True
+            
+            existing = self.semantic_cache.get(include=[])
+            if existing["ids"]:
+                self.semantic_cache.delete(ids=existing["ids"])
+            
+            return True
+        except Exception:
+            return False
+    
     def _setup_chain(self):
         """Set up the RAG chain with prompt template."""
         if not self.llm:
             return
         
-        # Create prompt template
-        prompt_template = ChatPromptTemplate.from_template("""
-You are an intelligent research assistant. Answer the question based ONLY on the provided context from the user's documents.
-
-IMPORTANT RULES:
-1. Only use information from the provided context
-2. If the answer is not in the context, respond with "I couldn't find information about this in your documents."
-3. Be concise and accurate
-4. Cite specific parts of the context when possible
-5. Do not make assumptions or add information not in the context
-
-Context from documents:
-{context}
-
-Question: {question}
-
-Answer:""")
+        from langchain_core.output_parsers import StrOutputParser
         
         # Create the chain
         self.chain = (
             {"context": lambda x: self._format_docs(x["context"]), "question": lambda x: x["question"]}
-            | prompt_template
+            | _get_prompt()
             | self.llm
             | StrOutputParser()
         )
     
-    def _format_docs(self, docs: List[Document]) -> str:
+    def _format_docs(self, docs: List["Document"]) -> str:
         """Format retrieved documents for the prompt."""
         if not docs:
             return "No relevant documents found."
         
-        formatted_docs = []
-        for i, doc in enumerate(docs, 1):
-            source = doc.metadata.get('source_file', 'Unknown')
-            content = doc.page_content.strip()
-            formatted_docs.append(f"[Source {i}: {source}]\n{content}")
+        return _format_doc_entries(tuple(
+            (doc.metadata.get('source_file', 'Unknown'), doc.page_content) for doc in docs
+        ))
+    
+    def _build_sources(self, docs_with_scores: List[tuple]) -> List[Dict[str, Any]]:
+        """Prepare sources information for retrieved documents."""
+        scores = np.asarray([score for _, score in docs_with_scores], dtype=np.float32)
+        relevance_scores = _normalize_scores(scores)
         
-        return "\n\n".join(formatted_docs)
+        sources = []
+        for i, (doc, score) in enumerate(docs_with_scores):
+            source_info = {
+                "source_file": doc.metadata.get('source_file', 'Unknown'),
+                # Chunks ingested before previews were stored fall back to truncating here
+                "content": doc.metadata.get('preview') or make_preview(doc.page_content),
+                "relevance_score": relevance_scores[i],
+                "chunk_id": doc.metadata.get('chunk_id', i)
+            }
+            sources.append(source_info)
+        
+        return sources
+    
+    def _cache_result(self, question: str, question_embedding: Optional[List[float]], result: Dict[str, Any], doc_hash: str):
+        """Store a query result in both the exact-match and semantic caches."""
+        if self.cache_manager:
+            self.cache_manager.cache_query(question, result, doc_hash)
+        self._cache_semantic_query(question, question_embedding, result, doc_hash)
+    
+    def _search(self, question: str, question_embedding: Optional[List[float]]) -> List[tuple]:
+        """Retrieve relevant documents, reusing the question embedding when available."""
+        if question_embedding is not None:
+            return self.vector_store.similarity_search_by_vector_with_score(
+                question_embedding, k=config.TOP_K_RETRIEVAL
+            )
+        
+        return self.vector_store.similarity_search_with_score(
+            question, k=config.TOP_K_RETRIEVAL
+        )
+    
+    def _embed_and_search(self, question: str) -> Tuple[Optional[List[float]], List[tuple]]:
+        """Embed the question and retrieve relevant documents."""
+        question_embedding = self.vector_store.embed_query(question)
+        return question_embedding, self._search(question, question_embedding)
+    
+    def _semantic_cache_hit(self, question: str, question_embedding: Optional[List[float]], doc_hash: str) -> Optional[Dict[str, Any]]:
+        """Return a cached result for a rephrasing of an earlier question, promoting it to the exact cache."""
+        cached_result = self._get_semantic_cached_query(question_embedding, doc_hash)
+        if cached_result and self.cache_manager:
+            self.cache_manager.cache_query(question, cached_result, doc_hash)
+        
+        return cached_result
+    
+    def _finish_retrieval(self, question: str, question_embedding: Optional[List[float]], docs_with_scores: List[tuple], doc_hash: str) -> Tuple[Optional[Dict[str, Any]], List[tuple], Optional[List[float]], str]:
+        """Answer directly when retrieval found nothing, otherwise pass the documents on."""
+        if not docs_with_scores:
+            result = {
+                "answer": "I couldn't find information about this in your documents.",
+                "sources": [],
+                "error": False
+            }
+            # Cache the result
+            self._cache_result(question, question_embedding, result, doc_hash)
+            return result, [], question_embedding, doc_hash
+        
+        return None, docs_with_scores, question_embedding, doc_hash
+    
+    def _retrieve(self, question: str) -> Tuple[Optional[Dict[str, Any]], List[tuple], Optional[List[float]], str]:
+        """Check the caches and retrieve context for a question.
+        
+        Returns (early_result, docs_with_scores, question_embedding, doc_hash); early_result
+        is set when the answer is already known and no generation is needed.
+        """
+        collection_info = self.vector_store.get_collection_info()
+        doc_hash = str(collection_info.get("document_count", 0))
+        
+        # Check exact-match cache first if cache manager is available
+        if self.cache_manager:
+            cached_result = self.cache_manager.get_cached_query(question, doc_hash)
+            if cached_result:
+                return cached_result, [], None, doc_hash
+        
+        # Check the semantic cache before paying for the document search
+        question_embedding = self.vector_store.embed_query(question)
+        cached_result = self._semantic_cache_hit(question, question_embedding, doc_hash)
+        if cached_result:
+            return cached_result, [], question_embedding, doc_hash
+        
+        docs_with_scores = self._search(question, question_embedding)
+        return self._finish_retrieval(question, question_embedding, docs_with_scores, doc_hash)
+    
+    async def _aretrieve(self, question: str) -> Tuple[Optional[Dict[str, Any]], List[tuple], Optional[List[float]], str]:
+        """Like _retrieve, but runs embedding and retrieval speculatively during the cache lookup."""
+        collection_info = self.vector_store.get_collection_info()
+        doc_hash = str(collection_info.get("document_count", 0))
+        
+        loop = asyncio.get_running_loop()
+        retrieval = loop.run_in_executor(_RETRIEVAL_EXECUTOR, self._embed_and_search, question)
+        
+        # Check exact-match cache while retrieval is in flight; a hit abandons the retrieval
+        if self.cache_manager:
+            cached_result = await loop.run_in_executor(
+                _RETRIEVAL_EXECUTOR, self.cache_manager.get_cached_query, question, doc_hash
+            )
+            if cached_result:
+                retrieval.cancel()
+                return cached_result, [], None, doc_hash
+        
+        question_embedding, docs_with_scores = await retrieval
+        
+        # Fall back to the semantic cache for rephrasings of earlier questions
+        cached_result = self._semantic_cache_hit(question, question_embedding, doc_hash)
+        if cached_result:
+            return cached_result, [], question_embedding, doc_hash
+        
+        return self._finish_retrieval(question, question_embedding, docs_with_scores, doc_hash)
     
     def query(self, question: str) -> Dict[str, Any]:
         """Process a query through the RAG pipeline."""
@@ -96,31 +338,9 @@ Answer:""")
                     "error": True
                 }
             
-            # Check cache first if cache manager is available
-            if self.cache_manager:
-                collection_info = self.vector_store.get_collection_info()
-                doc_hash = str(collection_info.get("document_count", 0))
-                cached_result = self.cache_manager.get_cached_query(question, doc_hash)
-                if cached_result:
-                    return cached_result
-            
-            # Retrieve relevant documents
-            docs_with_scores = self.vector_store.similarity_search_with_score(
-                question, k=config.TOP_K_RETRIEVAL
-            )
-            
-            if not docs_with_scores:
-                result = {
-                    "answer": "I couldn't find information about this in your documents.",
-                    "sources": [],
-                    "error": False
-                }
-                # Cache the result
-                if self.cache_manager:
-                    collection_info = self.vector_store.get_collection_info()
-                    doc_hash = str(collection_info.get("document_count", 0))
-                    self.cache_manager.cache_query(question, result, doc_hash)
-                return result
+            early_result, docs_with_scores, question_embedding, doc_hash = self._retrieve(question)
+            if early_result:
+                return early_result
             
             # Extract documents and scores
             docs = [doc for doc, score in docs_with_scores]
@@ -129,28 +349,14 @@ Answer:""")
             # Generate answer using the chain
             answer = self.chain.invoke({"question": question, "context": docs})
             
-            # Prepare sources information
-            sources = []
-            for i, (doc, score) in enumerate(docs_with_scores):
-                source_info = {
-                    "source_file": doc.metadata.get('source_file', 'Unknown'),
-                    "content": doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content,
-                    "relevance_score": float(score),
-                    "chunk_id": doc.metadata.get('chunk_id', i)
-                }
-                sources.append(source_info)
-            
             result = {
                 "answer": answer,
-                "sources": sources,
+                "sources": self._build_sources(docs_with_scores),
                 "error": False
             }
             
             # Cache the result
-            if self.cache_manager:
-                collection_info = self.vector_store.get_collection_info()
-                doc_hash = str(collection_info.get("document_count", 0))
-                self.cache_manager.cache_query(question, result, doc_hash)
+            self._cache_result(question, question_embedding, result, doc_hash)
             
             return result
             
@@ -162,6 +368,138 @@ Answer:""")
                 "error": True
             }
     
+    def stream_query(self, question: str) -> Tuple[Iterator[str], Dict[str, Any]]:
+        """Process a query through the RAG pipeline, streaming the answer as it is generated.
+        
+        Cache lookups and retrieval run before this returns, so callers can show progress
+        for them; the returned iterator only streams generation. The response dict's answer
+        is filled in (and the result cached) once the iterator has been fully consumed.
+        """
+        response = {"answer": "", "sources": [], "error": False}
+        
+        def error_stream(message: str) -> Iterator[str]:
+            response.update({"answer": message, "sources": [], "error": True})
+            return iter([message])
+        
+        try:
+            if not self.chain or not self.vector_store.is_initialized():
+                return error_stream("System not properly initialized. Please check your API key and try again."), response
+            
+            early_result, docs_with_scores, question_embedding, doc_hash = asyncio.run(self._aretrieve(question))
+            if early_result:
+                response.update(early_result)
+                return iter([response["answer"]]), response
+            
+            response["sources"] = self._build_sources(docs_with_scores)
+            
+        except Exception as e:
+            st.error(f"Error processing query: {str(e)}")
+            return error_stream("An error occurred while processing your question. Please try again."), response
+        
+        def generate() -> Iterator[str]:
+            try:
+                # Stream the answer from the chain, accumulating it for the cache
+                docs = [doc for doc, score in docs_with_scores]
+                chunks = []
+                for chunk in self.chain.stream({"question": question, "context": docs}):
+                    chunks.append(chunk)
+                    yield chunk
+                response["answer"] = "".join(chunks)
+                
+                # Cache the result
+                self._cache_result(question, question_embedding, response, doc_hash)
+                
+            except Exception as e:
+                st.error(f"Error processing query: {str(e)}")
+                yield next(error_stream("An error occurred while processing your question. Please try again."))
+        
+        return generate(), response
+    
+    def query_batch(self, questions: List[str]) -> List[Dict[str, Any]]:
+        """Process several queries with one embedding call, one retrieval call and one LLM batch."""
+        try:
+            if not self.chain or not self.vector_store.is_initialized():
+                return [{
+                    "answer": "System not properly initialized. Please check your API key and try again.",
+                    "sources": [],
+                    "error": True
+                } for _ in questions]
+            
+            collection_info = self.vector_store.get_collection_info()
+            doc_hash = str(collection_info.get("document_count", 0))
+            results: List[Optional[Dict[str, Any]]] = [None] * len(questions)
+            
+            # Check exact-match cache first if cache manager is available
+            if self.cache_manager:
+                for i, question in enumerate(questions):
+                    results[i] = self.cache_manager.get_cached_query(question, doc_hash)
+            
+            pending = [i for i, result in enumerate(results) if not result]
+            if not pending:
+                return results
+            
+            # Embed all remaining questions in a single call
+            embeddings = self.vector_store.embed_queries([questions[i] for i in pending])
+            if embeddings is None:
+                for i in pending:
+                    results[i] = self.query(questions[i])
+                return results
+            question_embeddings = dict(zip(pending, embeddings))
+            
+            # Fall back to the semantic cache for rephrasings of earlier questions
+            for i in pending:
+                results[i] = self._semantic_cache_hit(questions[i], question_embeddings[i], doc_hash)
+            
+            pending = [i for i in pending if not results[i]]
+            if not pending:
+                return results
+            
+            # Retrieve relevant documents for all remaining questions at once
+            retrieved = self.vector_store.similarity_search_by_vectors_with_score(
+                [question_embeddings[i] for i in pending], k=config.TOP_K_RETRIEVAL
+            )
+            
+            to_generate = []
+            for i, docs_with_scores in zip(pending, retrieved):
+                if docs_with_scores:
+                    to_generate.append((i, docs_with_scores))
+                else:
+                    results[i] = {
+                        "answer": "I couldn't find information about this in your documents.",
+                        "sources": [],
+                        "error": False
+                    }
+            
+            # Generate all answers with a single batched chain call
+            if to_generate:
+                answers = self.chain.batch(
+                    [
+                        {"question": questions[i], "context": [doc for doc, score in docs_with_scores]}
+                        for i, docs_with_scores in to_generate
+                    ],
+                    config={"max_concurrency": 8}
+                )
+                for (i, docs_with_scores), answer in zip(to_generate, answers):
+                    results[i] = {
+                        "answer": answer,
+                        "sources": self._build_sources(docs_with_scores),
+                        "error": False
+                    }
+            
+            # Cache the results
+            for i in pending:
+                self._cache_result(questions[i], question_embeddings[i], results[i], doc_hash)
+            
+            return results
+            
+        except Exception as e:
+            st.error(f"Error processing queries: {str(e)}")
+            return [{
+                "answer": "An error occurred while processing your question. Please try again.",
+                "sources": [],
+                "error": True
+            } for _ in questions]
+    
     def is_initialized(self) -> bool:
         """Check if the RAG chain is properly initialized."""
         return self.chain is not None and self.llm is not None
@@ -25,7 +25,12 @@ def install_dependencies():
     """Install required dependencies."""
     print("📦 Installing dependencies...")
     try:
-        subprocess.check_call([sys.executable, "-m", "pip", "install", "-r", "requirements.txt"])
+        try:
+            # uv resolves and fetches in parallel; target the running interpreter's environment
+            subprocess.check_call(["uv", "pip", "install", "--python", sys.executable, "-r", "requirements.txt"])
+        except FileNotFoundError:
+            print("ℹ️  uv not found, falling back to pip (run 'pip install uv' for faster installs)")
+            subprocess.check_call([sys.executable, "-m", "pip", "install", "-r", "requirements.txt"])
         print("✅ Dependencies installed successfully")
         return True
     except subprocess.CalledProcessError:
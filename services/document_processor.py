@@ -1,105 +1,198 @@
 """Document processing service using LlamaIndex loaders."""
 
+import io
 import os
-import tempfile
-from typing import List, Optional
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterator, List, Optional, Tuple
 from pathlib import Path
 import streamlit as st
+import docx2txt
+import pypdf
 
 from llama_index.core import Document
-from llama_index.readers.file import PDFReader, DocxReader
 from llama_index.core.node_parser import SentenceSplitter
 
 from config.settings import config
+from utils.hash_utils import hash_document
+from utils.text_utils import make_preview
+
+
+# Worker pool shared across uploads; spawned (not forked) since the Streamlit server is multi-threaded.
+# Workers start on demand, so a batch of N files never spawns more than N of them.
+MAX_PARSE_WORKERS = 4
+_PROCESS_POOL: Optional[ProcessPoolExecutor] = None
+_PROCESS_POOL_LOCK = threading.Lock()
+
+# Per-worker-process processor, reused across files
+_worker_processor: Optional["DocumentProcessor"] = None
+
+
+def _get_process_pool() -> ProcessPoolExecutor:
+    """Get or create the process pool used for parallel parsing and chunking."""
+    global _PROCESS_POOL
+    with _PROCESS_POOL_LOCK:
+        if _PROCESS_POOL is None:
+            _PROCESS_POOL = ProcessPoolExecutor(
+                max_workers=min(os.cpu_count() or 1, MAX_PARSE_WORKERS),
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _PROCESS_POOL
+
+
+def _reset_process_pool():
+    """Drop a broken process pool so the next upload starts a fresh one."""
+    global _PROCESS_POOL
+    with _PROCESS_POOL_LOCK:
+        _PROCESS_POOL = None
+
+
+def _process_file_worker(file_bytes: bytes, file_extension: str, file_name: str,
+                         chunk_size: int, chunk_overlap: int) -> Tuple[List[str], List[dict]]:
+    """Parse and chunk one file in a worker process.
+    
+    Returns parallel (texts, metadatas) lists so no LlamaIndex objects are pickled between processes.
+    """
+    global _worker_processor
+    splitter = _worker_processor.text_splitter if _worker_processor else None
+    if not splitter or (splitter.chunk_size, splitter.chunk_overlap) != (chunk_size, chunk_overlap):
+        _worker_processor = DocumentProcessor(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    
+    return _worker_processor._chunk_file(io.BytesIO(file_bytes), file_extension, file_name)
 
 
 class DocumentProcessor:
     """Handles document ingestion and processing using LlamaIndex."""
     
-    def __init__(self):
-        self.pdf_reader = PDFReader()
-        self.docx_reader = DocxReader()
+    def __init__(self, chunk_size: int = None, chunk_overlap: int = None):
         self.text_splitter = SentenceSplitter(
-            chunk_size=config.CHUNK_SIZE,
-            chunk_overlap=config.CHUNK_OVERLAP
+            chunk_size=chunk_size or config.CHUNK_SIZE,
+            chunk_overlap=chunk_overlap if chunk_overlap is not None else config.CHUNK_OVERLAP
         )
     
     def process_uploaded_file(self, uploaded_file) -> Optional[List[Document]]:
         """Process an uploaded file and return LlamaIndex documents."""
-        try:
+        chunks = self._chunk_upload(uploaded_file)
+        if not chunks:
+            return None
+        
+        texts, metadatas = chunks
+        return [Document(text=text, metadata=metadata) for text, metadata in zip(texts, metadatas)]
+    
+    def process_uploaded_files(self, uploaded_files) -> Iterator[Tuple[int, Optional[Tuple[List[str], List[dict]]]]]:
+        """Process several uploaded files in parallel worker processes.
+        
+        Yields (index, (texts, metadatas)) pairs in completion order; the chunks are None for
+        files that failed or produced no text. A single file is processed in-process, since
+        starting a worker costs far more than parsing one small file.
+        """
+        if len(uploaded_files) == 1:
+            yield 0, self._chunk_upload(uploaded_files[0])
+            return
+        
+        pool = _get_process_pool()
+        futures = {}
+        for index, uploaded_file in enumerate(uploaded_files):
             # Check file size
             if uploaded_file.size > config.MAX_FILE_SIZE_MB * 1024 * 1024:
                 st.error(f"File size exceeds {config.MAX_FILE_SIZE_MB}MB limit")
-                return None
+                yield index, None
+                continue
             
-            # Get file extension
             file_extension = Path(uploaded_file.name).suffix.lower()
-            
-            # Save uploaded file temporarily
-            with tempfile.NamedTemporaryFile(delete=False, suffix=file_extension) as tmp_file:
-                tmp_file.write(uploaded_file.getvalue())
-                tmp_file_path = tmp_file.name
-            
+            future = pool.submit(
+                _process_file_worker,
+                uploaded_file.getvalue(),
+                file_extension,
+                uploaded_file.name,
+                self.text_splitter.chunk_size,
+                self.text_splitter.chunk_overlap
+            )
+            futures[future] = index
+        
+        for future in as_completed(futures):
+            index = futures[future]
             try:
-                # Process based on file type
-                documents = self._load_document(tmp_file_path, file_extension, uploaded_file.name)
-                
-                if documents:
-                    # Split documents into chunks
-                    nodes = self.text_splitter.get_nodes_from_documents(documents)
-                    
-                    # Convert nodes back to documents with metadata
-                    chunked_docs = []
-                    for i, node in enumerate(nodes):
-                        doc = Document(
-                            text=node.text,
-                            metadata={
-                                **node.metadata,
-                                "source_file": uploaded_file.name,
-                                "chunk_id": i,
-                                "file_type": file_extension
-                            }
-                        )
-                        chunked_docs.append(doc)
-                    
-                    return chunked_docs
-                
-            finally:
-                # Clean up temporary file
-                os.unlink(tmp_file_path)
-                
-        except Exception as e:
-            st.error(f"Error processing file {uploaded_file.name}: {str(e)}")
-            return None
+                texts, metadatas = future.result()
+            except Exception as e:
+                if isinstance(e, BrokenProcessPool):
+                    _reset_process_pool()
+                st.error(f"Error processing file {uploaded_files[index].name}: {str(e)}")
+                yield index, None
+                continue
+            
+            yield index, (texts, metadatas) if texts else None
     
-    def _load_document(self, file_path: str, file_extension: str, original_name: str) -> Optional[List[Document]]:
-        """Load document based on file type."""
+    def _chunk_upload(self, uploaded_file) -> Optional[Tuple[List[str], List[dict]]]:
+        """Chunk an uploaded file in this process, reporting errors like the worker path does."""
         try:
-            if file_extension == ".pdf":
-                documents = self.pdf_reader.load_data(file_path)
-            elif file_extension == ".docx":
-                documents = self.docx_reader.load_data(file_path)
-            elif file_extension in [".txt", ".md"]:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                documents = [Document(text=content)]
-            else:
-                st.error(f"Unsupported file type: {file_extension}")
+            # Check file size
+            if uploaded_file.size > config.MAX_FILE_SIZE_MB * 1024 * 1024:
+                st.error(f"File size exceeds {config.MAX_FILE_SIZE_MB}MB limit")
                 return None
             
-            # Add source metadata
-            for doc in documents:
-                doc.metadata.update({
-                    "source_file": original_name,
-                    "file_type": file_extension
-                })
-            
-            return documents
+            # Get file extension
+            file_extension = Path(uploaded_file.name).suffix.lower()
             
+            # Parse straight from the upload buffer rather than a getvalue() copy of it
+            uploaded_file.seek(0)
+            texts, metadatas = self._chunk_file(uploaded_file, file_extension, uploaded_file.name)
+            return (texts, metadatas) if texts else None
+        
         except Exception as e:
-            st.error(f"Error loading document: {str(e)}")
+            st.error(f"Error processing file {uploaded_file.name}: {str(e)}")
             return None
     
+    def _chunk_file(self, file_obj: io.BytesIO, file_extension: str, original_name: str) -> Tuple[List[str], List[dict]]:
+        """Load an in-memory file and split it into parallel chunk text and metadata lists."""
+        # Process based on file type
+        documents = self._load_document(file_obj, file_extension, original_name)
+        
+        # Split documents into chunks
+        nodes = self.text_splitter.get_nodes_from_documents(documents)
+        
+        # Keep chunks as parallel lists instead of one Document object per chunk
+        base_metadata = {
+            "source_file": original_name,
+            "file_type": file_extension,
+            # Identifies this exact file content, so same-named uploads never share chunk ids
+            "document_hash": hash_document(file_obj.getbuffer(), original_name)
+        }
+        texts = [node.text for node in nodes]
+        metadatas = [
+            {**node.metadata, **base_metadata, "chunk_id": i, "preview": make_preview(text)}
+            for i, (node, text) in enumerate(zip(nodes, texts))
+        ]
+        
+        return texts, metadatas
+    
+    def _load_document(self, file_obj: io.BytesIO, file_extension: str, original_name: str) -> List[Document]:
+        """Load document from an in-memory binary file object based on file type."""
+        if file_extension == ".pdf":
+            pdf = pypdf.PdfReader(file_obj)
+            documents = [
+                Document(text=page.extract_text(), metadata={"page_label": label, "file_name": original_name})
+                for page, label in zip(pdf.pages, pdf.page_labels)
+            ]
+        elif file_extension == ".docx":
+            content = docx2txt.process(file_obj)
+            documents = [Document(text=content, metadata={"file_name": original_name})]
+        elif file_extension in [".txt", ".md"]:
+            documents = [Document(text=file_obj.read().decode('utf-8'))]
+        else:
+            raise ValueError(f"Unsupported file type: {file_extension}")
+        
+        # Add source metadata
+        for doc in documents:
+            doc.metadata.update({
+                "source_file": original_name,
+                "file_type": file_extension
+            })
+        
+        return documents
+    
     def get_document_stats(self, documents: List[Document]) -> dict:
         """Get statistics about processed documents."""
         if not documents:
@@ -2,7 +2,13 @@
 
 import os
 import hashlib
-from typing import List, Optional, Dict, Any
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import closing
+from typing import List, Optional, Dict, Any, Set, Union
+import numpy as np
 import streamlit as st
 from pathlib import Path
 
@@ -12,6 +18,46 @@ from langchain_core.documents import Document as LangChainDocument
 from llama_index.core import Document as LlamaIndexDocument
 
 from config.settings import config
+from utils.hash_utils import document_hasher as _document_hasher, hash_document
+
+
+# Process-wide LRU of query embeddings, shared by every VectorStoreService instance
+_QUERY_EMBEDDING_CACHE: "OrderedDict[tuple, tuple]" = OrderedDict()
+_QUERY_EMBEDDING_CACHE_SIZE = 1024
+_QUERY_EMBEDDING_CACHE_LOCK = threading.Lock()
+
+# Collection metadata flag marking that every stored vector is unit length
+_NORMALIZED_MARKER = "vectors_normalized"
+
+
+def _l2_normalize(vectors) -> np.ndarray:
+    """L2-normalize embedding rows so their inner product equals cosine similarity."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1.0)
+
+
+class CachedEmbeddings(GoogleGenerativeAIEmbeddings):
+    """Gemini embeddings that memoize embed_query so repeated questions skip the API call."""
+    
+    def embed_query(self, text: str, **kwargs) -> List[float]:
+        if kwargs:
+            return super().embed_query(text, **kwargs)
+        
+        key = (self.model, hashlib.sha256(text.encode()).hexdigest())
+        with _QUERY_EMBEDDING_CACHE_LOCK:
+            vector = _QUERY_EMBEDDING_CACHE.get(key)
+            if vector is not None:
+                _QUERY_EMBEDDING_CACHE.move_to_end(key)
+                return list(vector)
+        
+        vector = tuple(super().embed_query(text))
+        with _QUERY_EMBEDDING_CACHE_LOCK:
+            _QUERY_EMBEDDING_CACHE[key] = vector
+            if len(_QUERY_EMBEDDING_CACHE) > _QUERY_EMBEDDING_CACHE_SIZE:
+                _QUERY_EMBEDDING_CACHE.popitem(last=False)
+        
+        return list(vector)
 
 
 class VectorStoreService:
@@ -19,8 +65,13 @@ class VectorStoreService:
     
     def __init__(self, user_session_id: str = None):
         self.embeddings = None
-        self.vector_store = None
+        self._vector_store: Optional[Chroma] = None
+        self._chroma_kwargs: Optional[Dict[str, Any]] = None
         self.user_session_id = user_session_id
+        self._doc_count_cache: Optional[int] = None
+        self._dedup_db_path: Optional[str] = None
+        # Document hashes known to be stored, so repeated document_exists calls skip the probe
+        self._hash_seen: Set[str] = set()
         self._initialize_embeddings()
         self._initialize_vector_store()
     
@@ -31,7 +82,7 @@ class VectorStoreService:
                 print("Google API key not found. Please set GOOGLE_API_KEY environment variable.")
                 return
             
-            self.embeddings = GoogleGenerativeAIEmbeddings(
+            self.embeddings = CachedEmbeddings(
                 model=config.GEMINI_EMBEDDING_MODEL,
                 google_api_key=config.GOOGLE_API_KEY
             )
@@ -39,8 +90,61 @@ class VectorStoreService:
         except Exception as e:
             print(f"Error initializing embeddings: {str(e)}")
     
+    @property
+    def vector_store(self) -> Optional[Chroma]:
+        """LangChain Chroma wrapper, built on first use."""
+        if self._vector_store is None and self._chroma_kwargs:
+            try:
+                import chromadb
+                
+                kwargs = dict(self._chroma_kwargs)
+                # chromadb shares one underlying system per path, so this reuses any open index
+                kwargs["client"] = chromadb.PersistentClient(
+                    path=kwargs["persist_directory"],
+                    settings=kwargs.pop("client_settings")
+                )
+                self._vector_store = Chroma(embedding_function=self.embeddings, **kwargs)
+                self._normalize_stored_vectors(self._vector_store._collection)
+            except Exception as e:
+                print(f"Error initializing vector store: {str(e)}")
+                self._chroma_kwargs = None
+        
+        return self._vector_store
+    
+    def _normalize_stored_vectors(self, collection, page_size: int = 1000):
+        """Rescale vectors written before ingest normalized them, once per collection.
+        
+        Collections created earlier keep their original distance space, and unnormalized
+        rows would rank by magnitude instead of cosine similarity under it.
+        """
+        try:
+            metadata = collection.metadata or {}
+            if metadata.get(_NORMALIZED_MARKER):
+                return
+            
+            offset = 0
+            while True:
+                page = collection.get(include=["embeddings"], limit=page_size, offset=offset)
+                if not page["ids"]:
+                    break
+                vectors = np.asarray(page["embeddings"], dtype=np.float32)
+                stale = np.abs(np.linalg.norm(vectors, axis=1) - 1.0) > 1e-3
+                if stale.any():
+                    collection.update(
+                        ids=[row_id for row_id, flag in zip(page["ids"], stale) if flag],
+                        embeddings=_l2_normalize(vectors[stale])
+                    )
+                offset += len(page["ids"])
+            
+            # Chroma rejects hnsw:* keys on modify, and the index keeps them in its configuration anyway
+            metadata = {key: value for key, value in metadata.items() if not key.startswith("hnsw:")}
+            metadata[_NORMALIZED_MARKER] = True
+            collection.modify(metadata=metadata)
+        except Exception as e:
+            print(f"Error normalizing stored vectors: {str(e)}")
+    
     def _initialize_vector_store(self):
-        """Initialize ChromaDB vector store with complete session isolation."""
+        """Resolve the session-isolated ChromaDB settings; the store itself is opened lazily."""
         try:
             if not self.embeddings:
                 return
@@ -62,66 +166,178 @@ class VectorStoreService:
             else:
                 persist_directory = str(persist_dir)
             
-            # Force creation of separate ChromaDB client for each session
-            import chromadb
+            # Sidecar store of chunk content hash -> embedding, shared across uploads
+            self._dedup_db_path = str(Path(persist_directory) / "chunk_dedup.sqlite")
+            
+            # Each session gets its own persist directory, and so its own client
             from chromadb.config import Settings
             
-            # Create isolated client with session-specific settings
+            # Session-specific client settings
+            settings_kwargs = {}
+            # Only applied when the collection is created; existing collections keep their index
+            collection_metadata = {
+                "hnsw:space": config.HNSW_SPACE,
+                "hnsw:M": config.HNSW_M,
+                "hnsw:construction_ef": config.HNSW_CONSTRUCTION_EF,
+                "hnsw:search_ef": config.HNSW_SEARCH_EF,
+                _NORMALIZED_MARKER: True
+            }
+            if config.FAST_INGEST_MODE:
+                # Bound the segment cache and persist the HNSW index in larger batches
+                # so bulk uploads are not stalled by frequent index syncs to disk
+                settings_kwargs = {
+                    "chroma_segment_cache_policy": "LRU",
+                    "chroma_memory_limit_bytes": 512 * 1024 * 1024
+                }
+                collection_metadata.update({
+                    "hnsw:batch_size": config.FAST_INGEST_HNSW_BATCH_SIZE,
+                    "hnsw:sync_threshold": config.FAST_INGEST_HNSW_SYNC_THRESHOLD
+                })
+            
             client_settings = Settings(
                 persist_directory=persist_directory,
                 anonymized_telemetry=False,
-                allow_reset=True
-            )
-            
-            # Create a new client instance for this session
-            chroma_client = chromadb.PersistentClient(
-                path=persist_directory,
-                settings=client_settings
+                allow_reset=True,
+                **settings_kwargs
             )
             
-            # Initialize Chroma with the isolated client
-            self.vector_store = Chroma(
-                collection_name=collection_name,
-                embedding_function=self.embeddings,
-                client=chroma_client,
-                persist_directory=persist_directory
-            )
+            # Chroma's HNSW segment always stores float32 vectors, so quantizing
+            # embeddings before insert would not shrink the index or the bytes scanned per query.
+            self._chroma_kwargs = {
+                "collection_name": collection_name,
+                "client_settings": client_settings,
+                "persist_directory": persist_directory,
+                "collection_metadata": collection_metadata
+            }
             
         except Exception as e:
             print(f"Error initializing vector store: {str(e)}")
     
-    def add_documents(self, documents: List[LlamaIndexDocument]) -> bool:
-        """Add LlamaIndex documents to the vector store."""
+    def add_documents(self, documents: List[LlamaIndexDocument], insert_batch_size: int = 512) -> bool:
+        """Add LlamaIndex documents to the vector store in batches of insert_batch_size."""
+        return self.add_texts(
+            [doc.text for doc in documents],
+            [doc.metadata for doc in documents],
+            insert_batch_size=insert_batch_size
+        )
+    
+    def add_texts(self, texts: List[str], metadatas: List[Optional[Dict[str, Any]]], insert_batch_size: int = 512) -> bool:
+        """Add chunk texts with parallel metadata to the vector store in batches of insert_batch_size."""
         try:
-            if not self.vector_store or not documents:
+            if not self.vector_store or not texts:
                 return False
             
-            # Convert LlamaIndex documents to LangChain documents
-            langchain_docs = []
-            for doc in documents:
-                langchain_doc = LangChainDocument(
-                    page_content=doc.text,
-                    metadata=doc.metadata or {}
-                )
-                langchain_docs.append(langchain_doc)
+            # Content-derived ids make a retried ingest overwrite its earlier rows instead of
+            # duplicating them; only identical chunks share an id, so collapsing repeats loses nothing
+            chunks = {}
+            for text, metadata in zip(texts, metadatas):
+                chunks.setdefault(self._chunk_id(text, metadata), (text, metadata or None))
+            ids = list(chunks)
+            texts = [text for text, _ in chunks.values()]
+            metadatas = [metadata for _, metadata in chunks.values()]
             
-            # Add documents to vector store
-            self.vector_store.add_documents(langchain_docs)
+            # Upsert precomputed unit-length embeddings directly so Chroma does not re-embed
+            for start in range(0, len(texts), insert_batch_size):
+                batch_ids = ids[start:start + insert_batch_size]
+                batch_texts = texts[start:start + insert_batch_size]
+                batch_metadatas = metadatas[start:start + insert_batch_size]
+                existing = self.vector_store._collection.get(ids=batch_ids, include=[])["ids"]
+                self.vector_store._collection.upsert(
+                    ids=batch_ids,
+                    embeddings=_l2_normalize(self._embed_with_dedup(batch_texts, batch_metadatas)),
+                    documents=batch_texts,
+                    metadatas=batch_metadatas
+                )
+                
+                # Track each stored batch, so a later failing batch leaves the counts accurate
+                if self._doc_count_cache is not None:
+                    self._doc_count_cache += len(batch_ids) - len(existing)
+                
+                self._hash_seen.update(
+                    metadata["document_hash"] for metadata in batch_metadatas
+                    if metadata and "document_hash" in metadata
+                )
             
             return True
             
         except Exception as e:
+            # Recount on next use rather than trust the memoized value after a partial insert
+            self._doc_count_cache = None
             print(f"Error adding documents to vector store: {str(e)}")
             return False
     
+    def _chunk_id(self, text: str, metadata: Optional[Dict[str, Any]]) -> str:
+        """Stable row id derived from content: the chunk's position within its document's
+        content hash, or the chunk text itself when no document hash is known."""
+        metadata = metadata or {}
+        if "document_hash" in metadata and "chunk_id" in metadata:
+            key = f"{metadata['document_hash']}\0{metadata['chunk_id']}"
+        else:
+            key = f"{metadata.get('source_file', '')}\0{metadata.get('chunk_id', '')}\0{text}"
+        return hashlib.sha256(key.encode()).hexdigest()
+    
+    def _chunk_hash(self, text: str) -> str:
+        """Hash normalized chunk text together with the embedding model that embeds it."""
+        normalized = text.strip().lower()
+        return _document_hasher(f"{config.GEMINI_EMBEDDING_MODEL}\0{normalized}".encode()).hexdigest()
+    
+    def _embed_with_dedup(self, texts: List[str], metadatas: List[Optional[Dict[str, Any]]]) -> List[List[float]]:
+        """Embed texts, reusing stored vectors for chunks whose content was embedded before."""
+        if not self._dedup_db_path:
+            return self.embeddings.embed_documents(texts, batch_size=config.EMBED_BATCH_SIZE)
+        
+        hashes = [self._chunk_hash(text) for text in texts]
+        
+        with closing(sqlite3.connect(self._dedup_db_path)) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunk_hashes (hash TEXT PRIMARY KEY, vector BLOB, metadata TEXT)"
+            )
+            
+            # Look up known hashes, staying under SQLite's bound-parameter limit
+            known = {}
+            unique_hashes = list(dict.fromkeys(hashes))
+            for start in range(0, len(unique_hashes), 500):
+                batch = unique_hashes[start:start + 500]
+                rows = conn.execute(
+                    f"SELECT hash, vector FROM chunk_hashes WHERE hash IN ({','.join('?' * len(batch))})",
+                    batch
+                )
+                known.update((h, np.frombuffer(vector, dtype=np.float32).tolist()) for h, vector in rows)
+            
+            # Embed each unseen chunk once, even if it repeats within the batch
+            new = {}
+            for i, h in enumerate(hashes):
+                if h not in known and h not in new:
+                    new[h] = i
+            
+            if new:
+                vectors = self.embeddings.embed_documents(
+                    [texts[i] for i in new.values()], batch_size=config.EMBED_BATCH_SIZE
+                )
+                conn.executemany(
+                    "INSERT OR REPLACE INTO chunk_hashes (hash, vector, metadata) VALUES (?, ?, ?)",
+                    [
+                        (h, np.asarray(vector, dtype=np.float32).tobytes(), json.dumps(metadatas[i] or {}, default=str))
+                        for (h, i), vector in zip(new.items(), vectors)
+                    ]
+                )
+                conn.commit()
+                known.update(zip(new.keys(), vectors))
+        
+        return [known[h] for h in hashes]
+    
     def similarity_search(self, query: str, k: int = None) -> List[LangChainDocument]:
         """Perform similarity search and return relevant documents."""
         try:
             if not self.vector_store:
                 return []
             
+            embedding = self.embed_query(query)
+            if embedding is None:
+                return []
+            
             k = k or config.TOP_K_RETRIEVAL
-            results = self.vector_store.similarity_search(query, k=k)
+            results = self.vector_store.similarity_search_by_vector(embedding, k=k)
             
             return results
             
@@ -135,8 +351,12 @@ class VectorStoreService:
             if not self.vector_store:
                 return []
             
+            embedding = self.embed_query(query)
+            if embedding is None:
+                return []
+            
             k = k or config.TOP_K_RETRIEVAL
-            results = self.vector_store.similarity_search_with_score(query, k=k)
+            results = self.vector_store.similarity_search_by_vector_with_relevance_scores(embedding, k=k)
             
             return results
             
@@ -144,15 +364,97 @@ class VectorStoreService:
             print(f"Error performing similarity search with scores: {str(e)}")
             return []
     
+    def embed_query(self, query: str) -> Optional[List[float]]:
+        """Embed a query string with the configured embedding model, normalized like stored vectors."""
+        try:
+            if not self.embeddings:
+                return None
+            
+            return _l2_normalize(self.embeddings.embed_query(query)).tolist()
+        
+        except Exception as e:
+            print(f"Error embedding query: {str(e)}")
+            return None
+    
+    def embed_queries(self, queries: List[str]) -> Optional[List[List[float]]]:
+        """Embed several query strings in a single batched embedding call."""
+        try:
+            if not self.embeddings:
+                return None
+            
+            # Use the query task type so vectors are comparable with embed_query
+            return _l2_normalize(self.embeddings.embed_documents(
+                queries, batch_size=config.EMBED_BATCH_SIZE, task_type="retrieval_query"
+            )).tolist()
+        
+        except Exception as e:
+            print(f"Error embedding queries: {str(e)}")
+            return None
+    
+    def similarity_search_by_vectors_with_score(self, embeddings: List[List[float]], k: int = None) -> List[List[tuple]]:
+        """Perform one batched similarity search for several query embeddings."""
+        try:
+            if not self.vector_store:
+                return [[] for _ in embeddings]
+            
+            k = k or config.TOP_K_RETRIEVAL
+            results = self.vector_store._collection.query(
+                query_embeddings=embeddings,
+                n_results=k,
+                include=["documents", "metadatas", "distances"]
+            )
+            
+            return [
+                [
+                    (LangChainDocument(page_content=text, metadata=metadata or {}), distance)
+                    for text, metadata, distance in zip(texts, metadatas, distances)
+                ]
+                for texts, metadatas, distances in zip(
+                    results["documents"], results["metadatas"], results["distances"]
+                )
+            ]
+        
+        except Exception as e:
+            print(f"Error performing batched similarity search: {str(e)}")
+            return [[] for _ in embeddings]
+    
+    def similarity_search_by_vector_with_score(self, embedding: List[float], k: int = None) -> List[tuple]:
+        """Perform similarity search with relevance scores for a precomputed query embedding."""
+        try:
+            if not self.vector_store:
+                return []
+            
+            k = k or config.TOP_K_RETRIEVAL
+            results = self.vector_store.similarity_search_by_vector_with_relevance_scores(embedding, k=k)
+            
+            return results
+        
+        except Exception as e:
+            print(f"Error performing similarity search by vector: {str(e)}")
+            return []
+    
+    def get_or_create_collection(self, name: str, metadata: Optional[Dict[str, Any]] = None):
+        """Get or create an auxiliary raw Chroma collection on this session's client."""
+        try:
+            if not self.vector_store:
+                return None
+            
+            return self.vector_store._client.get_or_create_collection(name=name, metadata=metadata)
+        
+        except Exception as e:
+            print(f"Error getting collection {name}: {str(e)}")
+            return None
+    
     def get_collection_info(self) -> Dict[str, Any]:
         """Get information about the current collection."""
         try:
             if not self.vector_store:
                 return {"document_count": 0, "collection_name": config.COLLECTION_NAME}
             
-            # Get collection
-            collection = self.vector_store._collection
-            document_count = collection.count()
+            # Count once, then keep the memoized value in sync on writes
+            if self._doc_count_cache is None:
+                self._doc_count_cache = self.vector_store._collection.count()
+            document_count = self._doc_count_cache
             
             collection_name = (config.get_user_collection_name(self.user_session_id) 
                              if self.user_session_id 
@@ -174,9 +476,11 @@ class VectorStoreService:
             if not self.vector_store:
                 return False
             
-            # Delete the collection and recreate it
+            # Delete the collection; it is recreated on next use
             self.vector_store.delete_collection()
-            self._initialize_vector_store()
+            self._vector_store = None
+            self._doc_count_cache = 0
+            self._hash_seen.clear()
             
             return True
             
@@ -190,33 +494,39 @@ class VectorStoreService:
             if not self.vector_store:
                 return False
             
-            # Search for documents with the specific hash
-            results = self.vector_store.similarity_search(
-                query="",  # Empty query to get any documents
-                k=1000,    # Large k to check all documents
-                filter={"document_hash": document_hash}
+            if document_hash in self._hash_seen:
+                return True
+            
+            # Probe the metadata index directly; no embedding or vector search needed
+            results = self.vector_store._collection.get(
+                where={"document_hash": document_hash},
+                limit=1,
+                include=[]
             )
             
-            return len(results) > 0
+            if results["ids"]:
+                self._hash_seen.add(document_hash)
+                return True
+            
+            return False
             
         except Exception as e:
             # If filtering fails, assume document doesn't exist
             return False
     
-    def generate_document_hash(self, content: str, filename: str) -> str:
+    def generate_document_hash(self, content: Union[str, bytes], filename: str) -> str:
         """Generate a hash for document deduplication."""
-        combined = f"{filename}:{content}"
-        return hashlib.md5(combined.encode()).hexdigest()
+        return hash_document(content, filename)
     
     def is_initialized(self) -> bool:
-        """Check if the vector store is properly initialized."""
-        return self.vector_store is not None and self.embeddings is not None
+        """Check if the vector store is configured, without opening it."""
+        return self.embeddings is not None and self._chroma_kwargs is not None
     
     def close(self):
         """Properly close the vector store connection."""
         try:
-            if hasattr(self.vector_store, '_client') and self.vector_store._client:
+            if hasattr(self._vector_store, '_client') and self._vector_store._client:
                 # Reset the client to release file locks
-                self.vector_store._client.reset()
+                self._vector_store._client.reset()
         except Exception:
             pass  # Ignore errors during cleanup
@@ -3,9 +3,29 @@
 import sys
 import os
 
+# ChromaDB requires SQLite 3.35 or newer
+MIN_SQLITE_VERSION = (3, 35, 0)
+
 def fix_sqlite():
-    """Fix SQLite version compatibility for ChromaDB."""
+    """Fix SQLite version compatibility for ChromaDB.
+    
+    Safe to call on every Streamlit rerun: the outcome is memoized on sys, so
+    sys.modules is only swapped once per process.
+    """
+    if hasattr(sys, "_SQLITE_FIXED"):
+        return sys._SQLITE_FIXED
+    
+    if getattr(sys.modules.get('sqlite3'), '__name__', '') == 'pysqlite3.dbapi2':
+        sys._SQLITE_FIXED = True
+        return True
+    
     try:
+        import sqlite3
+        if sqlite3.sqlite_version_info >= MIN_SQLITE_VERSION:
+            print(f"✅ System SQLite version {sqlite3.sqlite_version} is supported")
+            sys._SQLITE_FIXED = True
+            return True
+        
         # Force pysqlite3 import before any other SQLite usage
         import pysqlite3.dbapi2 as sqlite3_new
         
@@ -14,16 +34,16 @@ def fix_sqlite():
         sys.modules['sqlite3.dbapi2'] = sqlite3_new
         
         print(f"✅ SQLite upgraded to version: {sqlite3_new.sqlite_version}")
+        sys._SQLITE_FIXED = True
         return True
         
     except ImportError:
         print("⚠️ pysqlite3 not available, using system SQLite")
         import sqlite3
         print(f"System SQLite version: {sqlite3.sqlite_version}")
+        sys._SQLITE_FIXED = False
         return False
     except Exception as e:
         print(f"❌ Error fixing SQLite: {e}")
+        sys._SQLITE_FIXED = False
         return False
-
-# Auto-execute on import
-fix_sqlite()
@@ -3,6 +3,7 @@ Test script to validate the RAG application components.
 Run this before deploying to ensure everything works correctly.
 """
 
+import importlib.util
 import os
 import sys
 from pathlib import Path
@@ -66,9 +67,38 @@ def test_config():
         return False
 
 def test_services():
-    """Test service initialization."""
+    """Test that service modules are present without initializing them."""
     print("\nTesting services...")
     
+    try:
+        service_modules = [
+            "services.document_processor",
+            "services.vector_store",
+            "core.rag_chain",
+            "utils.cache_manager"
+        ]
+        
+        for module_name in service_modules:
+            assert importlib.util.find_spec(module_name), f"{module_name} not found"
+        
+        print("[OK] All service modules found")
+        return True
+        
+    except Exception as e:
+        print(f"[ERROR] Service lookup error: {e}")
+        return False
+
+def test_services_full():
+    """Test service initialization (without API calls). Slow, so only runs with RUN_SLOW=1.
+    
+    Returns None when skipped.
+    """
+    print("\nTesting service initialization...")
+    
+    if os.getenv("RUN_SLOW") != "1":
+        print("[SKIP] Set RUN_SLOW=1 to initialize services")
+        return None
+    
     try:
         from services.document_processor import DocumentProcessor
         from services.vector_store import VectorStoreService
@@ -77,7 +107,6 @@ def test_services():
         
         print("[OK] All service modules imported successfully")
         
-        # Test service initialization (without API calls)
         doc_processor = DocumentProcessor()
         print("[OK] Document processor initialized")
         
@@ -90,6 +119,70 @@ def test_services():
         print(f"[ERROR] Service initialization error: {e}")
         return False
 
+def test_cache_manager():
+    """Test cache round-trips and running stats against a throwaway cache directory."""
+    print("\nTesting cache manager...")
+    
+    import tempfile
+    from config.settings import config
+    
+    original_cwd = os.getcwd()
+    original_settings = (config.ENABLE_CACHING, config.QUANTIZE_EMBEDDINGS, config.CACHE_TTL)
+    
+    try:
+        import numpy as np
+        from utils.cache_manager import CacheManager
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            os.chdir(tmp_dir)
+            config.ENABLE_CACHING = True
+            vector = np.linspace(-1.0, 1.0, 768, dtype=np.float32)
+            
+            # Embedding round-trips, exact for float32 and close for int8
+            config.QUANTIZE_EMBEDDINGS = False
+            cache_manager = CacheManager("test")
+            assert cache_manager.cache_embedding("float", vector)
+            assert np.array_equal(cache_manager.get_cached_embedding("float"), vector)
+            
+            config.QUANTIZE_EMBEDDINGS = True
+            assert cache_manager.cache_embedding("int8", vector)
+            restored = cache_manager.get_cached_embedding("int8")
+            cosine = float(np.dot(restored, vector) / (np.linalg.norm(restored) * np.linalg.norm(vector)))
+            assert cosine > 0.999, f"int8 round-trip cosine {cosine}"
+            print("[OK] Embedding round-trips with and without quantization")
+            
+            # Overwriting an entry replaces its size rather than counting it twice
+            stats = cache_manager.get_cache_stats()
+            assert cache_manager.cache_embedding("int8", vector)
+            assert cache_manager.get_cache_stats() == stats
+            assert stats["embedding_cache_count"] == 2
+            print("[OK] Overwrites do not double-count cache stats")
+            
+            # Query results expire after the TTL
+            assert cache_manager.cache_query("question", {"answer": "yes", "sources": []}, "1")
+            assert cache_manager.get_cached_query("question", "1") == {"answer": "yes", "sources": []}
+            config.CACHE_TTL = 0
+            assert cache_manager.get_cached_query("question", "1") is None
+            assert cache_manager.get_cache_stats()["query_cache_count"] == 0
+            print("[OK] Query results expire after the TTL")
+            
+            assert cache_manager.clear_cache()
+            stats = cache_manager.get_cache_stats()
+            assert stats["embedding_cache_count"] == 0 and stats["total_size_mb"] == 0
+            print("[OK] Clearing the cache resets stats")
+            
+            os.chdir(original_cwd)
+        
+        return True
+        
+    except Exception as e:
+        print(f"[ERROR] Cache manager error: {e!r}")
+        return False
+    
+    finally:
+        os.chdir(original_cwd)
+        config.ENABLE_CACHING, config.QUANTIZE_EMBEDDINGS, config.CACHE_TTL = original_settings
+
 def test_file_structure():
     """Test project file structure."""
     print("\nTesting file structure...")
@@ -99,6 +192,7 @@ def test_file_structure():
         "requirements.txt",
         "README.md",
         ".env.example",
+        ".streamlit/style.css",
         "config/__init__.py",
         "config/settings.py",
         "core/__init__.py",
@@ -132,7 +226,9 @@ def main():
         ("File Structure", test_file_structure),
         ("Imports", test_imports),
         ("Configuration", test_config),
-        ("Services", test_services)
+        ("Services", test_services),
+        ("Cache Manager", test_cache_manager),
+        ("Services (full)", test_services_full)
     ]
     
     results = []
@@ -149,11 +245,12 @@ def main():
     print("TEST SUMMARY")
     print("="*50)
     
+    # Skipped tests (None) count towards neither passes nor the total
     passed = sum(1 for _, result in results if result)
-    total = len(results)
+    total = sum(1 for _, result in results if result is not None)
     
     for test_name, result in results:
-        status = "[PASS]" if result else "[FAIL]"
+        status = "[SKIP]" if result is None else "[PASS]" if result else "[FAIL]"
         print(f"{test_name:<20} {status}")
     
     print(f"\nTests passed: {passed}/{total}")
@@ -1,14 +1,31 @@
 """Caching utilities for improved performance."""
 
 import hashlib
-import pickle
-import os
+import shutil
+import sqlite3
+import time
+from contextlib import closing
 from typing import Any, Optional
 from pathlib import Path
+import numpy as np
+import orjson
 import streamlit as st
 
 from config.settings import config
 
+# Maps cache types to their table and the prefix of their running stats
+_CACHE_TABLES = {"embedding": ("embeddings", "emb"), "query": ("queries", "qry")}
+
+
+def _cache_miss(*args, **kwargs) -> None:
+    """Lookup used when caching is disabled."""
+    return None
+
+
+def _cache_skip(*args, **kwargs) -> bool:
+    """Store used when caching is disabled."""
+    return False
+
 
 class CacheManager:
     """Manages caching for embeddings and query results."""
@@ -17,38 +34,73 @@ class CacheManager:
         self.user_session_id = user_session_id or "default"
         self.cache_dir = Path(".cache") / self.user_session_id
         self.cache_dir.mkdir(parents=True, exist_ok=True)
-        self.embeddings_cache_dir = self.cache_dir / "embeddings"
-        self.queries_cache_dir = self.cache_dir / "queries"
         
-        # Create subdirectories
-        self.embeddings_cache_dir.mkdir(exist_ok=True)
-        self.queries_cache_dir.mkdir(exist_ok=True)
+        # Both caches live in one SQLite file instead of one file per entry
+        self.db_path = self.cache_dir / "cache.sqlite"
+        with closing(self._connect()) as conn:
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, scale REAL, value BLOB);
+                CREATE TABLE IF NOT EXISTS queries (key TEXT PRIMARY KEY, created_at REAL, value BLOB);
+                CREATE TABLE IF NOT EXISTS cache_stats (name TEXT PRIMARY KEY, count INTEGER, bytes INTEGER);
+                INSERT OR IGNORE INTO cache_stats VALUES ('emb', 0, 0), ('qry', 0, 0);
+                """
+            )
+            conn.commit()
+        
+        # ENABLE_CACHING is read once here: with caching off, the lookups are shadowed by no-ops
+        if not config.ENABLE_CACHING:
+            self.get_cached_embedding = _cache_miss
+            self.cache_embedding = _cache_skip
+            self.get_cached_query = _cache_miss
+            self.cache_query = _cache_skip
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection to the cache database."""
+        return sqlite3.connect(self.db_path, timeout=10)
     
     def _generate_cache_key(self, data: str) -> str:
         """Generate a cache key from input data."""
         return hashlib.sha256(data.encode()).hexdigest()
     
-    def _get_cache_path(self, cache_type: str, key: str) -> Path:
-        """Get the full path for a cache file."""
-        if cache_type == "embedding":
-            return self.embeddings_cache_dir / f"{key}.pkl"
-        elif cache_type == "query":
-            return self.queries_cache_dir / f"{key}.pkl"
-        else:
-            raise ValueError(f"Unknown cache type: {cache_type}")
+    def _put(self, conn: sqlite3.Connection, cache_type: str, row: tuple):
+        """Insert or replace an entry, keeping the running stats in the same transaction."""
+        table, prefix = _CACHE_TABLES[cache_type]
+        previous = conn.execute(f"SELECT length(value) FROM {table} WHERE key = ?", (row[0],)).fetchone()
+        conn.execute(f"INSERT OR REPLACE INTO {table} VALUES (?, ?, ?)", row)
+        conn.execute(
+            "UPDATE cache_stats SET count = count + ?, bytes = bytes + ? WHERE name = ?",
+            (0 if previous else 1, len(row[2]) - (previous[0] if previous else 0), prefix)
+        )
+        conn.commit()
+    
+    def _delete(self, conn: sqlite3.Connection, cache_type: str, key: str):
+        """Delete an entry and update the running stats."""
+        table, prefix = _CACHE_TABLES[cache_type]
+        removed = conn.execute(f"SELECT length(value) FROM {table} WHERE key = ?", (key,)).fetchone()
+        if removed:
+            conn.execute(f"DELETE FROM {table} WHERE key = ?", (key,))
+            conn.execute(
+                "UPDATE cache_stats SET count = count - 1, bytes = bytes - ? WHERE name = ?",
+                (removed[0], prefix)
+            )
+        conn.commit()
     
     def get_cached_embedding(self, text: str) -> Optional[Any]:
         """Retrieve cached embedding for text."""
-        if not config.ENABLE_CACHING:
-            return None
-        
         try:
             cache_key = self._generate_cache_key(text)
-            cache_path = self._get_cache_path("embedding", cache_key)
             
-            if cache_path.exists():
-                with open(cache_path, 'rb') as f:
-                    return pickle.load(f)
+            with closing(self._connect()) as conn:
+                row = conn.execute("SELECT scale, value FROM embeddings WHERE key = ?", (cache_key,)).fetchone()
+            
+            if row:
+                scale, value = row
+                # int8 entries are dequantized only when read
+                if scale is not None:
+                    return np.frombuffer(value, dtype=np.int8).astype(np.float32) * np.float32(scale)
+                # Read-only view over the stored bytes, no copy
+                return np.frombuffer(value, dtype=np.float32)
         except Exception:
             pass
         
@@ -56,15 +108,20 @@ class CacheManager:
     
     def cache_embedding(self, text: str, embedding: Any) -> bool:
         """Cache an embedding for text."""
-        if not config.ENABLE_CACHING:
-            return False
-        
         try:
             cache_key = self._generate_cache_key(text)
-            cache_path = self._get_cache_path("embedding", cache_key)
+            vector = np.asarray(embedding, dtype=np.float32)
             
-            with open(cache_path, 'wb') as f:
-                pickle.dump(embedding, f)
+            if config.QUANTIZE_EMBEDDINGS:
+                # Per-vector symmetric int8: 4x smaller than float32, well under 1% cosine error
+                max_abs = float(np.abs(vector).max()) if vector.size else 0.0
+                scale = max_abs / 127 if max_abs > 0 else 1.0
+                row = (cache_key, scale, np.round(vector / scale).astype(np.int8).tobytes())
+            else:
+                row = (cache_key, None, vector.tobytes())
+            
+            with closing(self._connect()) as conn:
+                self._put(conn, "embedding", row)
             
             return True
         except Exception:
@@ -72,25 +129,20 @@ class CacheManager:
     
     def get_cached_query(self, query: str, doc_hash: str = "") -> Optional[Any]:
         """Retrieve cached query result."""
-        if not config.ENABLE_CACHING:
-            return None
-        
         try:
             cache_key = self._generate_cache_key(f"{query}:{doc_hash}")
-            cache_path = self._get_cache_path("query", cache_key)
             
-            if cache_path.exists():
-                # Check if cache is still valid (TTL)
-                import time
-                cache_age = cache_path.stat().st_mtime
-                current_time = time.time()
+            with closing(self._connect()) as conn:
+                row = conn.execute("SELECT created_at, value FROM queries WHERE key = ?", (cache_key,)).fetchone()
                 
-                if (current_time - cache_age) < config.CACHE_TTL:
-                    with open(cache_path, 'rb') as f:
-                        return pickle.load(f)
-                else:
-                    # Remove expired cache
-                    cache_path.unlink()
+                if row:
+                    # Check if cache is still valid (TTL)
+                    created_at, value = row
+                    if (time.time() - created_at) < config.CACHE_TTL:
+                        return orjson.loads(value)
+                    else:
+                        # Remove expired cache
+                        self._delete(conn, "query", cache_key)
         except Exception:
             pass
         
@@ -98,30 +150,36 @@ class CacheManager:
     
     def cache_query(self, query: str, result: Any, doc_hash: str = "") -> bool:
         """Cache a query result."""
-        if not config.ENABLE_CACHING:
-            return False
-        
         try:
             cache_key = self._generate_cache_key(f"{query}:{doc_hash}")
-            cache_path = self._get_cache_path("query", cache_key)
             
-            with open(cache_path, 'wb') as f:
-                pickle.dump(result, f)
+            # orjson serializes NumPy scalars such as float32 relevance scores directly
+            value = orjson.dumps(result, option=orjson.OPT_SERIALIZE_NUMPY)
+            
+            with closing(self._connect()) as conn:
+                self._put(conn, "query", (cache_key, time.time(), value))
             
             return True
         except Exception:
             return False
     
     def clear_cache(self, cache_type: Optional[str] = None) -> bool:
-        """Clear cache files."""
+        """Clear cached entries."""
         try:
-            if cache_type == "embedding" or cache_type is None:
-                for file in self.embeddings_cache_dir.glob("*.pkl"):
-                    file.unlink()
+            cache_types = [cache_type] if cache_type else list(_CACHE_TABLES)
+            
+            with closing(self._connect()) as conn:
+                for name in cache_types:
+                    table, prefix = _CACHE_TABLES[name]
+                    conn.execute(f"DELETE FROM {table}")
+                    conn.execute("UPDATE cache_stats SET count = 0, bytes = 0 WHERE name = ?", (prefix,))
+                conn.commit()
             
-            if cache_type == "query" or cache_type is None:
-                for file in self.queries_cache_dir.glob("*.pkl"):
-                    file.unlink()
+            # Sweep the legacy one-file-per-entry cache directories, which share the table names
+            for name in cache_types:
+                shutil.rmtree(self.cache_dir / _CACHE_TABLES[name][0], ignore_errors=True)
+            if cache_type is None:
+                (self.cache_dir / "stats.json").unlink(missing_ok=True)
             
             return True
         except Exception:
@@ -130,15 +188,15 @@ class CacheManager:
     def get_cache_stats(self) -> dict:
         """Get cache statistics."""
         try:
-            embedding_files = list(self.embeddings_cache_dir.glob("*.pkl"))
-            query_files = list(self.queries_cache_dir.glob("*.pkl"))
+            with closing(self._connect()) as conn:
+                stats = {name: (count, size) for name, count, size in conn.execute("SELECT * FROM cache_stats")}
             
-            embedding_size = sum(f.stat().st_size for f in embedding_files)
-            query_size = sum(f.stat().st_size for f in query_files)
+            embedding_count, embedding_size = stats["emb"]
+            query_count, query_size = stats["qry"]
             
             return {
-                "embedding_cache_count": len(embedding_files),
-                "query_cache_count": len(query_files),
+                "embedding_cache_count": embedding_count,
+                "query_cache_count": query_count,
                 "embedding_cache_size_mb": embedding_size / (1024 * 1024),
                 "query_cache_size_mb": query_size / (1024 * 1024),
                 "total_size_mb": (embedding_size + query_size) / (1024 * 1024)
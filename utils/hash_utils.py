@@ -0,0 +1,20 @@
+"""Content hashing shared by ingestion and the vector store."""
+
+import hashlib
+from typing import Union
+
+try:
+    from blake3 import blake3 as document_hasher
+except ImportError:
+    # blake2b is in the standard library and outpaces MD5 on 64-bit platforms
+    document_hasher = hashlib.blake2b
+
+
+def hash_document(content: Union[str, bytes, memoryview], filename: str) -> str:
+    """Hash a document's name and content for deduplication."""
+    # Hash incrementally so the content is never concatenated into a second copy
+    hasher = document_hasher()
+    hasher.update(filename.encode())
+    hasher.update(b":")
+    hasher.update(content.encode() if isinstance(content, str) else content)
+    return hasher.hexdigest()
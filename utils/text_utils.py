@@ -0,0 +1,8 @@
+"""Text helpers shared by ingestion and retrieval."""
+
+PREVIEW_LENGTH = 200
+
+
+def make_preview(text: str) -> str:
+    """Truncate chunk text for display in source cards."""
+    return text[:PREVIEW_LENGTH] + "..." if len(text) > PREVIEW_LENGTH else text